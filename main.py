@@ -8,33 +8,122 @@ from datetime import datetime
 import argparse
 import re
 import shutil
+import threading
+import hashlib
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Настройка глобального логгера
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/global.log", mode='a', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+def _init_logging():
+    """
+    Настройка глобального логгера (один раз, даже при повторном импорте модуля)
+    """
+    if logging.getLogger().handlers:
+        return
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("logs/global.log", mode='a', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+_init_logging()
 logger = logging.getLogger("GlobalLogger")
 
+# Паттерн для удаления ANSI escape-последовательностей
+_ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# Пример: 'Test Suites: 7 passed, 7 total'
+_TEST_SUITES_RE = re.compile(r'Test Suites:\s*(\d+) passed, (\d+) total')
+_PASSED_RE = re.compile(r'(\d+)\s+passed')
+# Строка deadlines.txt: 'solutions02.txt March 20, 2025 23:59 March 27, 2025 23:59'
+DEADLINE_FORMAT = '%B %d, %Y %H:%M'
+_DEADLINE_RE = re.compile(r'\s*(\S+)\s+(\S+\s+\d+,\s+\d+\s+\d+:\d+)\s+(\S+\s+\d+,\s+\d+\s+\d+:\d+)')
+# Сколько последних строк вывода упавших тестов попадает в лог
+FAILED_OUTPUT_TAIL = 50
+
+# Клонирование упирается в сеть, поэтому держим несколько клонов одновременно
+CLONE_WORKERS = 4
+# Тесты ждут дочерние процессы, их число ограничиваем количеством ядер
+TEST_WORKERS = os.cpu_count() or 1
+# Параллельные запуски по числовым директориям внутри одного репозитория
+DIR_WORKERS = max(2, TEST_WORKERS // 2)
+# Пулы вложены (репозитории × директории), поэтому общее число одновременных
+# установок и прогонов тестов ограничиваем одним семафором на весь процесс
+_SUBPROCESS_SLOTS = threading.BoundedSemaphore(TEST_WORKERS)
+# История не нужна: тесты используют рабочую копию, а дедлайн — только дату HEAD
+CLONE_OPTIONS = ['--depth=1', '--single-branch', '--no-tags']
+
+CACHE_ROOT = os.path.expanduser('~/.cache/test-checker')
+# Кэш установленных зависимостей, ключ — хэш манифеста и lock-файла
+DEPS_CACHE_DIR = os.path.join(CACHE_ROOT, 'deps')
+# Общие для всех студентов кэши пакетов: одинаковые зависимости скачиваются один раз
+NPM_CACHE_DIR = os.path.join(CACHE_ROOT, 'npm')
+POETRY_CACHE_DIR = os.path.join(CACHE_ROOT, 'poetry')
+# Для каждого менеджера пакетов: манифест, lock-файл, директория зависимостей и признак
+# привязки к пути (в .venv прописаны абсолютные пути, её нельзя переносить)
+DEPS_LAYOUT = {
+    'npm': ('package.json', 'package-lock.json', 'node_modules', False),
+    'poetry': ('pyproject.toml', 'poetry.lock', '.venv', True),
+}
+# Файл-признак для каждого типа проекта в порядке приоритета: при обоих файлах проект считается JS
+PROJECT_MARKERS = {
+    'js': 'package.json',
+    'python': 'pyproject.toml',
+}
+# Без аудита, рекламы и прогресс-бара; пакеты по возможности берутся из локального кэша npm
+NPM_FLAGS = ['--prefer-offline', '--no-audit', '--no-fund']
+# Окружение для всех запусков npm и poetry
+TOOL_ENV = {
+    'POETRY_VIRTUALENVS_IN_PROJECT': 'true',
+    'POETRY_CACHE_DIR': POETRY_CACHE_DIR,
+    'npm_config_cache': NPM_CACHE_DIR,
+    'npm_config_prefer_offline': 'true',
+    'npm_config_progress': 'false',
+}
+
+# Блокировки по пути к репозиторию: несколько студентов могут сдать один и тот же репозиторий
+_repo_locks = {}
+_repo_locks_guard = threading.Lock()
+
+def repo_lock(repo_path: str) -> threading.Lock:
+    """
+    Возвращает блокировку для директории репозитория
+    """
+    with _repo_locks_guard:
+        return _repo_locks.setdefault(repo_path, threading.Lock())
+
 def main():
-    parser = argparse.ArgumentParser(description='Test Runner for JavaScript repositories')
-    parser.add_argument('repos_file', help='File containing repository URLs')
+    parser = argparse.ArgumentParser(
+        description='Test Runner for JavaScript repositories. '
+                    'Without repos_file checks all assignments listed in deadlines.txt'
+    )
+    parser.add_argument('repos_file', nargs='?', help='File containing repository URLs')
     parser.add_argument(
         '--log-level',
-        default='DEBUG',
+        default='INFO',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
         help='Set the logging level'
     )
+    parser.add_argument(
+        '--clean',
+        action='store_true',
+        help='Remove cloned repositories before each assignment instead of updating them'
+    )
     args = parser.parse_args()
-    
-    runner = TestRunner(args.repos_file, log_level=args.log_level)
-    runner.run_all()
+
+    if args.repos_file:
+        runner = TestRunner(args.repos_file, log_level=args.log_level)
+        runner.run_all()
+    else:
+        process_all_assignments(clean=args.clean)
 
 class TestRunner:
     def __init__(self, repos_file: str, log_level: str = 'INFO'):
@@ -46,11 +135,23 @@ class TestRunner:
         self.logger.info("Initializing TestRunner")
         self.repos = self._read_repos(repos_file)
         self.results = {}
+        self._results_lock = threading.Lock()
 
     def _setup_logging(self):
         """
         Настройка логирования с указанным уровнем
         """
+        self.logger = logging.getLogger('TestRunner')
+        self.logger.setLevel(self.log_level)
+        # Собственные обработчики уже пишут всё нужное, не дублируем записи через корневой логгер
+        self.logger.propagate = False
+
+        if self.logger.handlers:
+            # Повторное создание TestRunner: обработчики уже добавлены, обновляем только уровень
+            for handler in self.logger.handlers:
+                handler.setLevel(self.log_level)
+            return
+
         if not os.path.exists('logs'):
             os.makedirs('logs')
 
@@ -58,9 +159,6 @@ class TestRunner:
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
 
-        self.logger = logging.getLogger('TestRunner')
-        self.logger.setLevel(self.log_level)
-
         log_file = f'logs/test_runner_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
         file_handler = logging.FileHandler(log_file)
         file_handler.setFormatter(formatter)
@@ -80,7 +178,7 @@ class TestRunner:
         self.logger.info(f"Reading repositories from {file_path}")
         try:
             with open(file_path, 'r') as f:
-                repos = [line.strip() for line in f if line.strip()]
+                repos = [repo for repo in (line.strip() for line in f) if repo]
             self.logger.info(f"Found {len(repos)} repositories")
             return repos
         except Exception as e:
@@ -91,26 +189,13 @@ class TestRunner:
         """
         Клонирование репозитория с уникальным именем директории
         """
-        self.logger.info(f"Cloning repository: {repo_url}")
-        
-        # Извлекаем имя пользователя и репозитория из URL
-        parts = repo_url.split('/')
-        user_name = parts[-2]
-        repo_name = parts[-1].replace('.git', '')
-        
-        # Создаем уникальное имя директории
-        unique_repo_path = os.path.join(temp_dir, f"{user_name}_{repo_name}")
-        
+        self.logger.info("Cloning repository: %s", repo_url)
         try:
-            if not os.path.exists(unique_repo_path):
-                self.logger.debug(f"Cloning to {unique_repo_path}")
-                git.Repo.clone_from(repo_url, unique_repo_path)
-                self.logger.info(f"Successfully cloned {repo_url}")
-            else:
-                self.logger.info(f"Repository already exists at {unique_repo_path}")
+            unique_repo_path = ensure_repo(repo_url, temp_dir)
+            self.logger.info("Repository %s is ready at %s", repo_url, unique_repo_path)
             return unique_repo_path
         except Exception as e:
-            self.logger.error(f"Error cloning repository {repo_url}: {str(e)}")
+            self.logger.error("Error cloning repository %s: %s", repo_url, e)
             raise
 
     def _parse_test_output(self, output: str) -> int:
@@ -119,40 +204,39 @@ class TestRunner:
         или в формате '1 passed'
         """
         self.logger.debug("Parsing test output")
-        self.logger.debug(f"Raw output: {output}")
+        # Вывод тестов может быть большим, не трогаем его без уровня DEBUG
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Raw output: %s", output)
         
         try:
-            # Паттерн для удаления ANSI escape-последовательностей
-            ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-            
             for line in output.split('\n'):
                 # Проверяем формат Test Suites
                 if 'Test Suites:' in line:
-                    self.logger.debug(f"Found line with test results: {line}")
+                    self.logger.debug("Found line with test results: %s", line)
                     # Очищаем строку от ANSI escape-последовательностей
-                    clean_line = ansi_escape.sub('', line)
-                    self.logger.debug(f"Clean line: {clean_line}")
+                    clean_line = _ANSI_ESCAPE.sub('', line)
+                    self.logger.debug("Clean line: %s", clean_line)
                     # Берем часть строки после "Test Suites:"
                     parts = clean_line.split('Test Suites:')[1]
                     # Извлекаем первое число из строки
                     passed_tests = int(parts.split('passed')[0].strip())
-                    self.logger.debug(f"Found {passed_tests} passed test suites")
+                    self.logger.debug("Found %s passed test suites", passed_tests)
                     return passed_tests
                 
                 # Проверяем альтернативный формат "X passed"
                 if 'passed' in line:
-                    clean_line = ansi_escape.sub('', line)
-                    self.logger.debug(f"Found alternative passed line: {clean_line}")
+                    clean_line = _ANSI_ESCAPE.sub('', line)
+                    self.logger.debug("Found alternative passed line: %s", clean_line)
                     # Ищем число перед словом "passed"
-                    match = re.search(r'(\d+)\s+passed', clean_line)
+                    match = _PASSED_RE.search(clean_line)
                     if match:
                         passed_tests = int(match.group(1))
-                        self.logger.debug(f"Found {passed_tests} passed tests")
+                        self.logger.debug("Found %s passed tests", passed_tests)
                         return passed_tests
                     
         except Exception as e:
-            self.logger.error(f"Error parsing test output: {str(e)}")
-            self.logger.error(f"Exception details:", exc_info=True)
+            self.logger.error("Error parsing test output: %s", e)
+            self.logger.error("Exception details:", exc_info=True)
         return 0
 
     def run_all(self, temp_dir: str = 'temp_repos'):
@@ -164,30 +248,60 @@ class TestRunner:
         if not os.path.exists(temp_dir):
             self.logger.debug(f"Creating temporary directory: {temp_dir}")
             os.makedirs(temp_dir)
+        os.makedirs(NPM_CACHE_DIR, exist_ok=True)
+        os.makedirs(POETRY_CACHE_DIR, exist_ok=True)
 
         # Проверяем, пуст ли файл repos_file
         if not self.repos:
             self.logger.info("No repositories found in repos_file, checking temp_repos directory.")
             # Получаем список всех репозиториев в temp_repos
-            self.repos = [os.path.join(temp_dir, d) for d in os.listdir(temp_dir) 
-                          if os.path.isdir(os.path.join(temp_dir, d))]
+            with os.scandir(temp_dir) as entries:
+                self.repos = [entry.path for entry in entries if entry.is_dir()]
 
-        for repo_url in self.repos:
-            try:
+        with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as clone_pool, \
+                ThreadPoolExecutor(max_workers=TEST_WORKERS) as test_pool:
+            clone_futures = {}
+            test_futures = {}
+            # Повторяющиеся URL обрабатываем один раз
+            for repo_url in dict.fromkeys(self.repos):
                 # Если это путь к локальному репозиторию, просто запускаем тесты
                 if os.path.isdir(repo_url):
-                    self.results[repo_url] = self.run_tests(repo_url)
+                    test_futures[test_pool.submit(run_tests, repo_url)] = repo_url
                 else:
-                    repo_path = self.clone_repo(repo_url, temp_dir)
-                    self.results[repo_url] = self.run_tests(repo_path)
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
-                self.logger.error(f"Failed to process repository {repo_url}: {error_msg}")
-                self.results[repo_url] = error_msg
+                    clone_futures[clone_pool.submit(self.clone_repo, repo_url, temp_dir)] = repo_url
+
+            # Запускаем тесты сразу по мере завершения клонирования
+            for future in as_completed(clone_futures):
+                repo_url = clone_futures[future]
+                try:
+                    repo_path = future.result()
+                except Exception as e:
+                    self._set_failed(repo_url, e)
+                    continue
+                test_futures[test_pool.submit(run_tests, repo_path)] = repo_url
+
+            for future in as_completed(test_futures):
+                repo_url = test_futures[future]
+                try:
+                    test_results = future.result()
+                except Exception as e:
+                    self._set_failed(repo_url, e)
+                    continue
+                with self._results_lock:
+                    self.results[repo_url] = test_results
 
         self.save_results()
         self.logger.info("Completed test run for all repositories")
 
+    def _set_failed(self, repo_url: str, error: Exception):
+        """
+        Сохранение ошибки обработки репозитория
+        """
+        error_msg = f"Error: {str(error)}"
+        self.logger.error(f"Failed to process repository {repo_url}: {error_msg}")
+        with self._results_lock:
+            self.results[repo_url] = error_msg
+
     def save_results(self, output_file: str = 'test_results.json'):
         """
         Сохранение результатов в JSON файл с добавлением статистики
@@ -198,8 +312,9 @@ class TestRunner:
             for repo_url, test_results in self.results.items():
                 if isinstance(test_results, dict):  # Если это словарь с результатами тестов
                     total_tests = len(test_results)
-                    passed_tests = sum(1 for result in test_results.values() 
-                                     if isinstance(result, int) and result > 0)
+                    # run_tests возвращает (passed, total) для каждой директории
+                    passed_tests = sum(1 for result in test_results.values()
+                                     if isinstance(result, tuple) and result[0] > 0)
                     
                     formatted_results[repo_url] = {
                         'details': test_results,
@@ -217,8 +332,13 @@ class TestRunner:
                         }
                     }
             
-            with open(output_file, 'w') as f:
-                json.dump(formatted_results, f, indent=2)
+            if orjson is not None:
+                with open(output_file, 'wb') as f:
+                    f.write(orjson.dumps(formatted_results, option=orjson.OPT_INDENT_2))
+            else:
+                # Как и orjson, пишем UTF-8 без экранирования кириллицы
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(formatted_results, f, indent=2, ensure_ascii=False)
             self.logger.info("Results saved successfully")
         except Exception as e:
             self.logger.error(f"Error saving results: {str(e)}")
@@ -232,14 +352,15 @@ def parse_deadlines(deadlines_file: str) -> dict:
     deadlines = {}
     with open(deadlines_file, 'r') as f:
         for line in f:
-            parts = line.strip().split()
-            if len(parts) >= 7:
-                fname = parts[0]
-                soft = ' '.join(parts[1:5])
-                hard = ' '.join(parts[5:9])
+            match = _DEADLINE_RE.match(line)
+            if match:
+                fname, soft, hard = match.groups()
+                # Внутри даты может быть несколько пробелов подряд, приводим к одному
+                soft = ' '.join(soft.split())
+                hard = ' '.join(hard.split())
                 deadlines[fname] = {
-                    'soft': datetime.strptime(soft, '%B %d, %Y %H:%M'),
-                    'hard': datetime.strptime(hard, '%B %d, %Y %H:%M')
+                    'soft': datetime.strptime(soft, DEADLINE_FORMAT),
+                    'hard': datetime.strptime(hard, DEADLINE_FORMAT)
                 }
     return deadlines
 
@@ -248,10 +369,10 @@ def get_last_commit_date(repo_path: str) -> datetime:
     """
     Возвращает дату последнего коммита в репозитории
     """
-    repo = git.Repo(repo_path)
-    commit = next(repo.iter_commits(), None)
-    if commit:
-        return datetime.fromtimestamp(commit.committed_date)
+    # Одна команда git вместо разбора репозитория через GitPython
+    timestamp = subprocess.check_output(['git', '-C', repo_path, 'log', '-1', '--format=%ct'], text=True).strip()
+    if timestamp:
+        return datetime.fromtimestamp(int(timestamp))
     return None
 
 
@@ -264,14 +385,45 @@ def check_deadline(commit_date: datetime, soft: datetime, hard: datetime) -> str
         return 'дедлайн превышен'
 
 
-def process_assignment(solutions_file: str, deadlines: dict, temp_dir: str = 'temp_repos', results_dir: str = 'results'):
+@functools.lru_cache(maxsize=None)
+def ensure_repo(repo_url: str, temp_dir: str) -> str:
+    """
+    Клонирует репозиторий или обновляет существующий клон и возвращает путь к нему.
+    Результат запоминается: повторные вызовы для того же URL в рамках запуска
+    не обращаются ни к git, ни к файловой системе.
     """
-    Обрабатывает одно задание: запускает тесты, формирует resultsXX.tsv
+    # Извлекаем имя пользователя и репозитория из URL
+    parts = repo_url.split('/')
+    user_name = parts[-2]
+    repo_name = parts[-1].replace('.git', '')
+    # Создаем уникальное имя директории
+    unique_repo_path = os.path.join(temp_dir, f"{user_name}_{repo_name}")
+    with repo_lock(unique_repo_path):
+        if not os.path.exists(unique_repo_path):
+            logger.info(f"Cloning repo {repo_url} to {unique_repo_path}")
+            git.Repo.clone_from(repo_url, unique_repo_path, multi_options=CLONE_OPTIONS)
+        else:
+            logger.info(f"Fetching latest changes for {repo_url}")
+            repo = git.Repo(unique_repo_path)
+            # Без слияния: сбрасываем рабочую копию на свежий HEAD, сохраняя неглубокий клон
+            repo.git.fetch('--depth=1', '--no-tags', 'origin', 'HEAD')
+            repo.git.reset('--hard', 'FETCH_HEAD')
+    return unique_repo_path
+
+def process_assignment(solutions_file: str, deadlines: dict, temp_dir: str = 'temp_repos', results_dir: str = 'results',
+                       clean: bool = False):
     """
-    # Очищаем временную директорию перед проверкой задания
-    if os.path.exists(temp_dir):
+    Обрабатывает одно задание: запускает тесты, формирует resultsXX.tsv.
+    Клоны из temp_dir переиспользуются и обновляются; при clean=True
+    временная директория очищается перед проверкой задания.
+    """
+    if clean and os.path.exists(temp_dir):
         shutil.rmtree(temp_dir)
-    os.makedirs(temp_dir)
+        # Клоны удалены, запомненные пути больше не действительны
+        ensure_repo.cache_clear()
+    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(NPM_CACHE_DIR, exist_ok=True)
+    os.makedirs(POETRY_CACHE_DIR, exist_ok=True)
     if not os.path.exists(results_dir):
         os.makedirs(results_dir)
     assignment = os.path.basename(solutions_file)
@@ -283,155 +435,222 @@ def process_assignment(solutions_file: str, deadlines: dict, temp_dir: str = 'te
         logger.warning(f"No deadline for {assignment}")
         print(f"No deadline for {assignment}")
         return
-    results_lines = []
+    students = []
     with open(solutions_file, 'r') as f:
         for line in f:
             if not line.strip():
                 continue
             name, repo_url = line.strip().split('\t')
-            try:
-                logger.info(f"Processing student: {name}")
-                # Клонируем или обновляем репозиторий
-                parts = repo_url.split('/')
-                user_name = parts[-2]
-                repo_name = parts[-1].replace('.git', '')
-                unique_repo_path = os.path.join(temp_dir, f"{user_name}_{repo_name}")
-                if not os.path.exists(unique_repo_path):
-                    logger.info(f"Cloning repo {repo_url} to {unique_repo_path}")
-                    git.Repo.clone_from(repo_url, unique_repo_path)
-                else:
-                    logger.info(f"Pulling latest changes for {repo_url}")
-                    repo = git.Repo(unique_repo_path)
-                    repo.remotes.origin.pull()
-                # Запуск тестов
-                test_results = run_tests(unique_repo_path)
-                passed = sum(v[0] for v in test_results.values())
-                total = sum(v[1] for v in test_results.values())
-                failed = total - passed
-                # Дата последнего коммита
-                commit_date = get_last_commit_date(unique_repo_path)
-                commit_date_str = commit_date.strftime('%Y-%m-%d %H:%M') if commit_date else '-'
-                # Проверка дедлайна
-                deadline_status = check_deadline(commit_date, deadline['soft'], deadline['hard']) if commit_date else '-'
-                # Сохраняем строку в список
-                results_lines.append((name, f"{name}\t{passed}\t{failed}\t{commit_date_str}\t{deadline_status}\n"))
-                logger.info(f"Result for {name}: {passed} passed, {failed} failed, commit {commit_date_str}, deadline {deadline_status}")
-            except Exception as e:
-                logger.error(f"Error processing {name}: {str(e)}")
-                results_lines.append((name, f"{name}\tERROR\tERROR\t-\t-\n"))
+            students.append((name, repo_url))
+    results_lines = []
+    with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as pool:
+        futures = [pool.submit(process_student, name, repo_url, deadline, temp_dir)
+                   for name, repo_url in students]
+        for future in as_completed(futures):
+            results_lines.append(future.result())
     # Сортируем по ФИО
     results_lines.sort(key=lambda x: x[0])
     # Записываем в файл
     with open(result_file, 'w') as out:
-        for _, line in results_lines:
-            out.write(line)
+        out.write(''.join(line for _, line in results_lines))
+
+def process_student(name: str, repo_url: str, deadline: dict, temp_dir: str) -> tuple:
+    """
+    Клонирует репозиторий студента, запускает тесты и возвращает (ФИО, строка для resultsXX.tsv)
+    """
+    try:
+        logger.info(f"Processing student: {name}")
+        unique_repo_path = ensure_repo(repo_url, temp_dir)
+        with repo_lock(unique_repo_path):
+            # Запуск тестов
+            test_results = run_tests(unique_repo_path)
+            passed = sum(v[0] for v in test_results.values())
+            total = sum(v[1] for v in test_results.values())
+            failed = total - passed
+            # Дата последнего коммита
+            commit_date = get_last_commit_date(unique_repo_path)
+            commit_date_str = commit_date.strftime('%Y-%m-%d %H:%M') if commit_date else '-'
+            # Проверка дедлайна
+            deadline_status = check_deadline(commit_date, deadline['soft'], deadline['hard']) if commit_date else '-'
+        logger.info(f"Result for {name}: {passed} passed, {failed} failed, commit {commit_date_str}, deadline {deadline_status}")
+        return name, f"{name}\t{passed}\t{failed}\t{commit_date_str}\t{deadline_status}\n"
+    except Exception as e:
+        logger.error(f"Error processing {name}: {str(e)}")
+        return name, f"{name}\tERROR\tERROR\t-\t-\n"
+
+def npm_install_cmd(project_path: str) -> List[str]:
+    """
+    Команда установки npm: 'npm ci' при наличии package-lock.json, иначе 'npm install'
+    """
+    if os.path.exists(os.path.join(project_path, 'package-lock.json')):
+        return ['npm', 'ci', *NPM_FLAGS]
+    return ['npm', 'install', *NPM_FLAGS]
+
+def run_install(project_path: str, install_cmd: List[str]):
+    """
+    Запуск команды установки. Если 'npm ci' упал (например, lock-файл
+    не совпадает с package.json), повторяем через 'npm install'.
+    """
+    env = {**os.environ, **TOOL_ENV}
+    # stdout установщиков (прогресс, логи) не нужен, в случае ошибки достаточно stderr
+    if install_cmd[:2] == ['npm', 'ci']:
+        try:
+            subprocess.run(install_cmd, cwd=project_path, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            return
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"npm ci failed in {project_path}, falling back to npm install: {e.stderr}")
+            install_cmd = ['npm', 'install', *install_cmd[2:]]
+    subprocess.run(install_cmd, cwd=project_path, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
 
-def parse_test_output(output: str) -> tuple:
+def install_dependencies(project_path: str, install_cmd: List[str]):
     """
-    Парсит вывод тестов и возвращает (passed, total) по строке 'Test Suites: X passed, Y total'.
-    Если не найдено — возвращает (0, 0).
+    Установка зависимостей проекта. Если для манифеста и lock-файла уже есть архив в кэше,
+    зависимости распаковываются из него, иначе выполняется установка и результат
+    сохраняется в кэш.
     """
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+    manifest_file, lock_file, deps_dir, path_bound = DEPS_LAYOUT[install_cmd[0]]
+    lock_path = os.path.join(project_path, lock_file)
+    if not os.path.exists(lock_path):
+        run_install(project_path, install_cmd)
+        return
+
+    # Ключ учитывает и манифест: тот же lock-файл при другом package.json/pyproject.toml
+    # даёт другой набор зависимостей
+    digest = hashlib.sha256()
+    for file_path in (os.path.join(project_path, manifest_file), lock_path):
+        with open(file_path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    if path_bound:
+        digest.update(os.path.abspath(project_path).encode())
+    tarball = os.path.join(DEPS_CACHE_DIR, f"{deps_dir.lstrip('.')}-{digest.hexdigest()}.tar.zst")
+
+    if os.path.exists(tarball):
+        logger.info(f"Restoring {deps_dir} from cache {tarball}")
+        try:
+            subprocess.run(['tar', '--use-compress-program=zstd', '-xf', tarball, '-C', project_path],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            return
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.warning(f"Failed to restore {deps_dir} from cache: {str(e)}")
+
+    run_install(project_path, install_cmd)
+
+    if not os.path.isdir(os.path.join(project_path, deps_dir)):
+        return
+    logger.info(f"Saving {deps_dir} to cache {tarball}")
+    os.makedirs(DEPS_CACHE_DIR, exist_ok=True)
+    # Пишем во временный файл, чтобы параллельные запуски не увидели недописанный архив
+    tmp_tarball = f"{tarball}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        for line in output.split('\n'):
-            if 'Test Suites:' in line:
-                clean_line = ansi_escape.sub('', line)
-                # Пример: 'Test Suites: 7 passed, 7 total'
-                match = re.search(r'Test Suites:\s*(\d+) passed, (\d+) total', clean_line)
+        subprocess.run(['tar', '--use-compress-program=zstd', '-cf', tmp_tarball, '-C', project_path, deps_dir],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        os.replace(tmp_tarball, tarball)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Failed to save {deps_dir} to cache: {str(e)}")
+        if os.path.exists(tmp_tarball):
+            os.remove(tmp_tarball)
+
+def run_test_command(test_cmd: List[str], cwd: str) -> tuple:
+    """
+    Запускает тесты и разбирает вывод построчно по мере поступления, не накапливая его целиком.
+    Возвращает (returncode, passed, total, последние строки вывода).
+    Счётчики берутся из строки 'Test Suites: X passed, Y total', а если её нет —
+    из первой строки вида 'X passed'; если не найдено ничего — (0, 0).
+    """
+    suites = None
+    alternative = None
+    tail = deque(maxlen=FAILED_OUTPUT_TAIL)
+    with subprocess.Popen(test_cmd, cwd=cwd, env={**os.environ, **TOOL_ENV},
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, bufsize=1) as process:
+        for line in process.stdout:
+            tail.append(line)
+            if suites is None and 'Test Suites:' in line:
+                match = _TEST_SUITES_RE.search(_ANSI_ESCAPE.sub('', line))
                 if match:
-                    passed = int(match.group(1))
-                    total = int(match.group(2))
-                    logger.info(f"Test Suites parsed: {passed} passed, {total} total")
-                    return passed, total
-            if 'passed' in line:
-                clean_line = ansi_escape.sub('', line)
-                match = re.search(r'(\d+)\s+passed', clean_line)
+                    suites = int(match.group(1)), int(match.group(2))
+            if alternative is None and 'passed' in line:
+                match = _PASSED_RE.search(_ANSI_ESCAPE.sub('', line))
                 if match:
                     passed = int(match.group(1))
-                    logger.info(f"Alternative passed line parsed: {passed} passed")
-                    return passed, passed
+                    alternative = passed, passed
+        returncode = process.wait()
+    passed, total = suites or alternative or (0, 0)
+    return returncode, passed, total, tail
+
+def detect_project_type(project_path: str) -> str:
+    """
+    Определяет тип проекта ('js' или 'python') по файлу-признаку, None если тип неизвестен.
+    Признаки проверяются в порядке PROJECT_MARKERS и проверка останавливается на первом
+    найденном: для JS-проекта это один вызов stat вместо двух.
+    """
+    for project_type, marker in PROJECT_MARKERS.items():
+        if os.path.exists(os.path.join(project_path, marker)):
+            return project_type
+    return None
+
+def run_dir_tests(dir_path: str) -> tuple:
+    """
+    Установка зависимостей и запуск тестов JS или Python проекта в одной директории.
+    Возвращает (passed, total), при любой ошибке — (0, 0).
+    """
+    logger.info("Processing directory %s", dir_path)
+    try:
+        project_type = detect_project_type(dir_path)
+        if project_type == 'js':
+            install_cmd = npm_install_cmd(dir_path)
+            test_cmd = ['npm', 'test']
+        elif project_type == 'python':
+            install_cmd = ['poetry', 'install']
+            test_cmd = ['poetry', 'run', 'pytest']
+        else:
+            logger.warning("Unknown project type in %s", dir_path)
+            return 0, 0
+        with _SUBPROCESS_SLOTS:
+            logger.info("Running install command: %s", ' '.join(install_cmd))
+            install_dependencies(dir_path, install_cmd)
+            logger.info("Running test command: %s", ' '.join(test_cmd))
+            returncode, passed, total, tail = run_test_command(test_cmd, dir_path)
+        if returncode != 0:
+            logger.error("Test failed in %s: %s", dir_path, ''.join(tail))
+            return 0, 0
+        logger.info("Directory %s: %s passed, %s total", dir_path, passed, total)
+        return passed, total
+    except subprocess.CalledProcessError as e:
+        logger.error("Error in directory %s: %s\n%s", dir_path, e, e.stderr)
+        return 0, 0
     except Exception as e:
-        logger.error(f"Error parsing test output: {str(e)}")
-    return 0, 0
+        logger.error("Error in directory %s: %s", dir_path, e)
+        return 0, 0
 
 def run_tests(repo_path: str) -> dict:
     """
     Запуск тестов в каждой директории с поддержкой JS и Python проектов,
     либо из корня, если нет числовых директорий.
     """
-    results = {}
-    dirs = [d for d in os.listdir(repo_path)
-            if os.path.isdir(os.path.join(repo_path, d)) and d.isdigit()]
-    if dirs:
-        logger.info(f"Found {len(dirs)} test directories in {repo_path}")
-        for dir_name in sorted(dirs, key=int):
-            dir_path = os.path.join(repo_path, dir_name)
-            logger.info(f"Processing directory {dir_name}")
-            try:
-                is_js_project = os.path.exists(os.path.join(dir_path, 'package.json'))
-                is_python_project = os.path.exists(os.path.join(dir_path, 'pyproject.toml'))
-                if is_js_project:
-                    install_cmd = ['npm', 'install']
-                    test_cmd = ['npm', 'test']
-                elif is_python_project:
-                    install_cmd = ['poetry', 'install']
-                    test_cmd = ['poetry', 'run', 'pytest']
-                else:
-                    logger.warning(f"Unknown project type in {dir_path}")
-                    results[dir_name] = (0, 0)
-                    continue
-                logger.info(f"Running install command: {' '.join(install_cmd)}")
-                subprocess.run(install_cmd, cwd=dir_path, check=True, capture_output=True, text=True)
-                logger.info(f"Running test command: {' '.join(test_cmd)}")
-                test_process = subprocess.run(test_cmd, cwd=dir_path, capture_output=True, text=True)
-                if test_process.returncode != 0:
-                    logger.error(f"Test failed in {dir_path}: {test_process.stderr}")
-                    results[dir_name] = (0, 0)
-                    continue
-                full_output = test_process.stdout + test_process.stderr
-                passed, total = parse_test_output(full_output)
-                results[dir_name] = (passed, total)
-                logger.info(f"Directory {dir_name}: {passed} passed, {total} total")
-            except Exception as e:
-                logger.error(f"Error in directory {dir_name}: {str(e)}")
-                results[dir_name] = (0, 0)
-    else:
-        logger.info(f"No digit-named directories in {repo_path}, running tests from root.")
-        try:
-            is_js_project = os.path.exists(os.path.join(repo_path, 'package.json'))
-            is_python_project = os.path.exists(os.path.join(repo_path, 'pyproject.toml'))
-            if is_js_project:
-                install_cmd = ['npm', 'install']
-                test_cmd = ['npm', 'test']
-            elif is_python_project:
-                install_cmd = ['poetry', 'install']
-                test_cmd = ['poetry', 'run', 'pytest']
-            else:
-                logger.warning(f"Unknown project type in {repo_path}")
-                results['root'] = (0, 0)
-                return results
-            logger.info(f"Running install command: {' '.join(install_cmd)}")
-            subprocess.run(install_cmd, cwd=repo_path, check=True, capture_output=True, text=True)
-            logger.info(f"Running test command: {' '.join(test_cmd)}")
-            test_process = subprocess.run(test_cmd, cwd=repo_path, capture_output=True, text=True)
-            if test_process.returncode != 0:
-                logger.error(f"Test failed in {repo_path}: {test_process.stderr}")
-                results['root'] = (0, 0)
-            else:
-                full_output = test_process.stdout + test_process.stderr
-                passed, total = parse_test_output(full_output)
-                results['root'] = (passed, total)
-                logger.info(f"Repo {repo_path}: {passed} passed, {total} total")
-        except Exception as e:
-            logger.error(f"Error in repo {repo_path}: {str(e)}")
-            results['root'] = (0, 0)
-    return results
+    with os.scandir(repo_path) as entries:
+        dirs = [entry.name for entry in entries if entry.name.isdigit() and entry.is_dir()]
+    if not dirs:
+        logger.info("No digit-named directories in %s, running tests from root.", repo_path)
+        return {'root': run_dir_tests(repo_path)}
 
-if __name__ == '__main__':
-    # Автоматически обработать все solutionsXX.txt строго в порядке из deadlines.txt
-    deadlines = parse_deadlines('deadlines.txt')
-    solutions_dir = 'solutions'
-    results_dir = 'results'
+    logger.info("Found %s test directories in %s", len(dirs), repo_path)
+    dirs.sort(key=int)
+    # Задания в директориях независимы, поэтому запускаем их параллельно
+    with ThreadPoolExecutor(max_workers=DIR_WORKERS) as pool:
+        futures = {dir_name: pool.submit(run_dir_tests, os.path.join(repo_path, dir_name))
+                   for dir_name in dirs}
+    return {dir_name: futures[dir_name].result() for dir_name in dirs}
+
+def process_all_assignments(deadlines_file: str = 'deadlines.txt', solutions_dir: str = 'solutions',
+                            results_dir: str = 'results', clean: bool = False):
+    """
+    Обрабатывает все solutionsXX.txt строго в порядке из deadlines.txt,
+    пропуская задания, для которых уже есть resultsXX.tsv
+    """
+    deadlines = parse_deadlines(deadlines_file)
     for fname in deadlines.keys():
         solutions_path = os.path.join(solutions_dir, fname)
         match = re.search(r'\d+', fname)
@@ -441,4 +660,7 @@ if __name__ == '__main__':
             logger.info(f"Results already exist for {fname}, skipping.")
             continue
         if os.path.exists(solutions_path):
-            process_assignment(solutions_path, deadlines)
\ No newline at end of file
+            process_assignment(solutions_path, deadlines, results_dir=results_dir, clean=clean)
+
+if __name__ == '__main__':
+    main()